@@ -0,0 +1,299 @@
+"""Benchmark of sync, build and release tasks from scripts.py.
+Upstream and fork are local bare git repositories served through fake GitHub API (see fake_github.py),
+dependencies are installed from a generated local wheelhouse, so no network is used.
+Prints JSON results (time, git/pip subprocesses and API requests per stage) to be compared between revisions.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import hashlib
+import pathlib
+import zipfile
+import argparse
+import platform
+import tempfile
+import importlib
+import subprocess
+import contextlib
+
+from fake_github import FakeGithub
+
+
+SIZES = {
+    'small': dict(files=20, dirs=3, deps=2, commits=5),
+    'medium': dict(files=300, dirs=20, deps=10, commits=50),
+    'large': dict(files=3000, dirs=150, deps=40, commits=200),
+    'deep': dict(files=2000, dirs=50, deps=5, commits=2000),
+}
+UPSTREAM = 'upstream-dev/galaxy-plugin-bench'
+FORK = 'FriendsOfGalaxy/galaxy-integration-bench'
+# seconds a fresh interpreter may spend importing modules before a task starts (python -X importtime)
+IMPORT_BUDGETS = {'build': 0.05, 'sync': 0.3, 'release': 0.3, 'update_release_file': 0.3}
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ['git', '-c', 'user.name=Bench', '-c', 'user.email=bench@example.com', *args],
+        cwd=cwd, check=True, capture_output=True, text=True
+    )
+
+
+def make_wheelhouse(path: pathlib.Path, deps: int):
+    """Minimal pure python wheels benchpkg0..benchpkgN"""
+    path.mkdir(parents=True, exist_ok=True)
+    for i in range(deps):
+        name, version = f'benchpkg{i}', '1.0'
+        info = f'{name}-{version}.dist-info'
+        files = {
+            f'{name}/__init__.py': b'VALUE = 1\n' * 50,
+            f'{name}/test_{name}.py': b'def test():\n    pass\n',
+            f'{info}/METADATA': f'Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n'.encode(),
+            f'{info}/WHEEL': b'Wheel-Version: 1.0\nGenerator: benchmark\nRoot-Is-Purelib: true\nTag: py3-none-any\n',
+        }
+        record = ''.join(
+            f'{p},sha256={base64.urlsafe_b64encode(hashlib.sha256(c).digest()).rstrip(b"=").decode()},{len(c)}\n'
+            for p, c in files.items()
+        )
+        files[f'{info}/RECORD'] = (record + f'{info}/RECORD,,\n').encode()
+        with zipfile.ZipFile(path / f'{name}-{version}-py3-none-any.whl', 'w') as zf:
+            for p, c in files.items():
+                zf.writestr(p, c)
+
+
+def write_manifest(work: pathlib.Path, version: str):
+    manifest = {
+        "name": "Bench integration", "platform": "bench", "guid": "00000000-0000-0000-0000-000000000000",
+        "version": version, "description": "Synthetic integration", "author": "bench", "email": "bench@example.com",
+        "url": "https://example.com", "script": "plugin.py"
+    }
+    with open(work / 'src' / 'manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+
+def make_upstream(root: pathlib.Path, files: int, dirs: int, deps: int, commits: int) -> pathlib.Path:
+    """Synthetic integration with history of given length. Returns path of its working copy"""
+    work = root / 'upstream-work'
+    (work / 'src').mkdir(parents=True)
+    _git(work, 'init', '-q', '-b', 'master')
+    (work / 'requirements.txt').write_text(''.join(f'benchpkg{i}==1.0\n' for i in range(deps)))
+    (work / 'src' / 'plugin.py').write_text('print("plugin")\n')
+    # paths reserved for the fork, which sync must not take from upstream
+    (work / 'README.md').write_text('# upstream\n')
+    (work / '.github' / 'workflows').mkdir(parents=True)
+    (work / '.github' / 'workflows' / 'ci.yml').write_text('name: CI\n')
+    write_manifest(work, '1.0.0')
+    per_commit = max(1, files // commits)
+    for i in range(files):
+        module = work / 'src' / 'lib' / f'd{i % dirs}' / (f'test_m{i}.py' if i % 10 == 0 else f'm{i}.py')
+        module.parent.mkdir(parents=True, exist_ok=True)
+        module.write_text(f'# module {i}\n' + 'x = "' + 'a' * 1000 + '"\n')
+        if (i + 1) % per_commit == 0 or i == files - 1:
+            _git(work, 'add', '.')
+            _git(work, 'commit', '-q', '-m', f'change {i}')
+    _git(work, 'branch', 'fog_release')
+    make_side_branch(work)
+    _git(root, 'clone', '-q', '--bare', str(work), 'upstream.git')
+    _git(work, 'remote', 'add', 'origin', str(root / 'upstream.git'))
+    return work
+
+
+def make_side_branch(work: pathlib.Path):
+    """Development branch with large binaries and tags, which are never released"""
+    _git(work, 'checkout', '-q', '-b', 'experimental')
+    for i in range(3):
+        (work / f'assets{i}.bin').write_bytes(os.urandom(2 * 1024 * 1024))
+        _git(work, 'add', '.')
+        _git(work, 'commit', '-q', '-m', f'experimental assets {i}')
+        _git(work, 'tag', f'experimental-{i}')
+    _git(work, 'checkout', '-q', 'master')
+
+
+def bump_upstream(work: pathlib.Path, version: str, commits: int):
+    for i in range(commits - 1):
+        (work / 'src' / 'lib' / 'd0' / 'changed.py').write_text(f'STEP = {i}\n')
+        _git(work, 'add', '.')
+        _git(work, 'commit', '-q', '-m', f'step {i} towards {version}')
+    write_manifest(work, version)
+    (work / 'src' / 'lib' / 'd0' / 'changed.py').write_text(f'VERSION = "{version}"\n')
+    _git(work, 'add', '.')
+    _git(work, 'commit', '-q', '-m', f'version {version}')
+    _git(work, 'branch', '-f', 'fog_release')
+    _git(work, 'push', '-q', 'origin', 'master', 'fog_release')
+
+
+def make_fork(root: pathlib.Path):
+    """Fork after purge: only README and workflows on master"""
+    work = root / 'fork-work'
+    (work / '.github' / 'workflows').mkdir(parents=True)
+    _git(work, 'init', '-q', '-b', 'master')
+    (work / 'README.md').write_text('# fork\n')
+    (work / '.github' / 'workflows' / 'sync.yml').write_text('name: Synchronization\n')
+    _git(work, 'add', '.')
+    _git(work, 'commit', '-q', '-m', 'Reset repository')
+    _git(root, 'clone', '-q', '--bare', str(work), 'fork.git')
+
+
+def merge_autoupdate(fake: FakeGithub):
+    """What merging autoupdate pull request does"""
+    fork = fake.repos[FORK]
+    fork.git('update-ref', 'refs/heads/master', 'refs/heads/autoupdate')
+    for pull in fork.pulls:
+        pull['state'] = 'closed'
+
+
+class Bench:
+    def __init__(self, root: pathlib.Path, fake: FakeGithub, scripts, verbose=False):
+        self.root = root
+        self.fake = fake
+        self.scripts = scripts
+        self.verbose = verbose
+        self.runs = []
+        self.results = []
+        self._original_run = scripts._run
+
+        def counting_run(*args, **kwargs):
+            self.runs.append(args)
+            return self._original_run(*args, **kwargs)
+        scripts._run = counting_run
+
+    def close(self):
+        self.scripts._run = self._original_run
+
+    def checkout(self, name) -> pathlib.Path:
+        """Fresh fork checkout as done by actions/checkout"""
+        dest = self.root / 'checkouts' / name
+        _git(self.root, 'clone', '-q', str(self.root / 'fork.git'), str(dest))
+        return dest
+
+    def api(self):
+        return self.scripts.FogRepoManager('token', FORK, api_url=self.fake.url)
+
+    def stage(self, size, name, cwd, func, *args):
+        runs, requests = len(self.runs), len(self.fake.requests)
+        log = io.StringIO()
+        prev_cwd = os.getcwd()
+        os.chdir(cwd)
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(sys.stdout if self.verbose else log):
+                ret = func(*args)
+        except Exception:
+            sys.stderr.write(log.getvalue())
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            os.chdir(prev_cwd)
+        result = {
+            'size': size,
+            'stage': name,
+            'seconds': round(elapsed, 4),
+            'subprocesses': len(self.runs) - runs,
+            'api_requests': len(self.fake.requests) - requests,
+        }
+        self.results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+        return ret
+
+    def startup(self, size, task, setup):
+        """Import cost of scripts.py and of what main() sets up for the task, in a fresh interpreter"""
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import scripts\n{setup}'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True, capture_output=True, text=True
+        )
+        rows = [line.split('|') for line in proc.stderr.splitlines() if line.startswith('import time:')]
+        # skip interpreter startup, which is done with site module
+        rows = rows[[row[2].rstrip() for row in rows].index(' site') + 1:]
+        modules = {row[2].strip() for row in rows}
+        seconds = sum(int(row[0].split(':')[1]) for row in rows) / 1e6
+        result = {
+            'size': size,
+            'stage': f'import_{task}',
+            'seconds': round(seconds, 4),
+            'modules': len(modules),
+            'imports_github': any(m.split('.')[0] == 'github' for m in modules),
+            'within_budget': seconds <= IMPORT_BUDGETS[task],
+        }
+        self.results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+
+def bench_size(scripts, root: pathlib.Path, size: str, params: dict, verbose=False):
+    wheelhouse = root / 'wheelhouse'
+    make_wheelhouse(wheelhouse, params['deps'])
+    upstream_work = make_upstream(root, **params)
+    make_fork(root)
+    os.environ.update(PIP_NO_INDEX='1', PIP_FIND_LINKS=str(wheelhouse), PIP_DISABLE_PIP_VERSION_CHECK='1')
+
+    with FakeGithub() as fake:
+        fake.add_repo(UPSTREAM, root / 'upstream.git')
+        fake.add_repo(FORK, root / 'fork.git', parent=UPSTREAM)
+        bench = Bench(root, fake, scripts, verbose)
+
+        api_setup = f'scripts.FogRepoManager("token", "{FORK}", api_url="{fake.url}")'
+        bench.startup(size, 'build', 'scripts.BuildCache()')
+        for task in ['sync', 'release', 'update_release_file']:
+            bench.startup(size, task, api_setup)
+        bench.stage(size, 'sync_initial', bench.checkout('sync_initial'), lambda: scripts.sync(bench.api()))
+        merge_autoupdate(fake)
+        bench.stage(size, 'sync_noop_cold', bench.checkout('sync_noop_cold'), lambda: scripts.sync(bench.api()))
+        bench.stage(size, 'sync_noop_warm', bench.checkout('sync_noop_warm'), lambda: scripts.sync(bench.api()))
+        bump_upstream(upstream_work, '1.0.1', max(1, params['commits'] // 10))
+        bench.stage(size, 'sync_update', bench.checkout('sync_update'), lambda: scripts.sync(bench.api()))
+        merge_autoupdate(fake)
+
+        build_cache = scripts.BuildCache(root / 'build-cache')
+        checkout = bench.checkout('release')
+        build_dir = root / 'build'
+        bench.stage(size, 'build_cold', checkout, scripts.build, build_dir, FORK, build_cache, ['windows', 'macos'])
+        bench.stage(size, 'build_warm', checkout, scripts.build, build_dir, FORK, build_cache, ['windows', 'macos'])
+        bench.stage(size, 'release', checkout, lambda: scripts.release(build_dir, bench.api()))
+        bench.stage(size, 'update_release_file', checkout, lambda: scripts.update_release_file(bench.api()))
+        bench.close()
+    return bench.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='small,medium', help=f'comma separated: {",".join(SIZES)}')
+    parser.add_argument('--output', help='file for JSON results; printed to stdout by default')
+    parser.add_argument('--verbose', action='store_true', help='show output of benchmarked tasks')
+    args = parser.parse_args()
+
+    root = pathlib.Path(tempfile.mkdtemp(prefix='fog-bench-'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    scripts = importlib.import_module('scripts')
+
+    results = []
+    try:
+        for size in args.sizes.split(','):
+            size_root = root / size
+            size_root.mkdir()
+            scripts.CACHE_DIR = size_root / 'cache'
+            results.extend(bench_size(scripts, size_root, size, SIZES[size], args.verbose))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'git': subprocess.run(['git', '--version'], capture_output=True, text=True).stdout.strip(),
+        'commit': subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip(),
+        'sizes': {size: SIZES[size] for size in args.sizes.split(',')},
+        'results': results,
+    }
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
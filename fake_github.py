@@ -0,0 +1,449 @@
+"""Local stand-in for the part of GitHub REST API used by our scripts.
+Repositories are backed by local bare git repositories. Every request is recorded, so callers can count them.
+"""
+
+import os
+import re
+import json
+import base64
+import threading
+import tempfile
+import subprocess
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROUTES = []
+
+
+def route(verb, pattern):
+    def decorator(func):
+        ROUTES.append((verb, re.compile(pattern + '$'), func))
+        return func
+    return decorator
+
+
+class FakeRepo:
+    def __init__(self, full_name, path, parent=None, license_key='mit', default_branch='master'):
+        self.full_name = full_name
+        self.path = str(path)
+        self.parent = parent
+        self.license_key = license_key
+        self.default_branch = default_branch
+        self.pulls = []
+        self.releases = []
+
+    def git(self, *args, check=True, **kwargs):
+        return subprocess.run(['git', '--git-dir', self.path, *args], capture_output=True, check=check, **kwargs)
+
+
+class FakeGithub:
+    """Serves fake GitHub API on localhost in a background thread. Use as a context manager"""
+
+    def __init__(self, login='FriendsOfGalaxy'):
+        self.login = login
+        self.repos = {}
+        self.requests = []
+        self.fail_uploads = {}  # asset name -> number of uploads to fail
+        self.rate_limit = None  # (remaining, reset timestamp) reported in headers when set
+        self.truncate_trees = False  # recursive tree listings report truncation, as github does for huge repositories
+        self._ids = iter(range(1, 10 ** 9))
+        self._lock = threading.Lock()
+        self._server = None
+
+    def add_repo(self, full_name, path, parent=None, **kwargs) -> FakeRepo:
+        repo = FakeRepo(full_name, path, parent, **kwargs)
+        self.repos[full_name] = repo
+        return repo
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                fake._dispatch(self)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _dispatch(self, handler):
+        parsed = urllib.parse.urlparse(handler.path)
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        with self._lock:
+            self.requests.append((handler.command, parsed.path))
+
+        status, data, headers = 404, {'message': 'Not Found'}, {}
+        for verb, pattern, func in ROUTES:
+            match = pattern.match(parsed.path)
+            if verb == handler.command and match:
+                params = match.groupdict()
+                repo = self.repos.get(f'{params.pop("owner", "")}/{params.pop("name", "")}')
+                if repo is None and 'owner' in pattern.pattern:
+                    break
+                with self._lock:
+                    result = func(self, repo, query=query, body=body, headers=handler.headers, **params)
+                status, data = result[:2]
+                headers = result[2] if len(result) > 2 else {}
+                break
+
+        etag = headers.get('ETag')
+        if status == 200 and etag is not None and handler.headers.get('If-None-Match') == etag:
+            status, data = 304, None
+
+        payload = b'' if data is None else json.dumps(data).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(payload)))
+        if self.rate_limit is not None:
+            remaining, reset = self.rate_limit
+            handler.send_header('X-RateLimit-Limit', '5000')
+            handler.send_header('X-RateLimit-Remaining', str(remaining))
+            handler.send_header('X-RateLimit-Reset', str(int(reset)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    # json representations
+
+    def _repo_json(self, repo):
+        owner, name = repo.full_name.split('/')
+        data = {
+            'id': abs(hash(repo.full_name)) % 10 ** 6,
+            'name': name,
+            'full_name': repo.full_name,
+            'owner': {'login': owner, 'url': f'{self.url}/users/{owner}', 'html_url': f'https://github.com/{owner}'},
+            'url': f'{self.url}/repos/{repo.full_name}',
+            'html_url': f'https://github.com/{repo.full_name}',
+            'clone_url': f'file://{repo.path}',
+            'default_branch': repo.default_branch,
+            'created_at': '2019-06-01T00:00:00Z',
+            'fork': repo.parent is not None,
+        }
+        if repo.parent is not None:
+            data['parent'] = self._repo_json(self.repos[repo.parent])
+        return data
+
+    def _pull_json(self, repo, pull):
+        url = f'{self.url}/repos/{repo.full_name}'
+        return dict(pull, url=f'{url}/pulls/{pull["number"]}', issue_url=f'{url}/issues/{pull["number"]}')
+
+    def _release_json(self, repo, rel):
+        url = f'{self.url}/repos/{repo.full_name}/releases'
+        return dict(
+            rel,
+            url=f'{url}/{rel["id"]}',
+            upload_url=f'{self.url}/uploads/repos/{repo.full_name}/releases/{rel["id"]}/assets{{?name,label}}',
+            assets=[self._asset_json(repo, a) for a in rel['assets']]
+        )
+
+    def _asset_json(self, repo, asset):
+        return dict(
+            asset,
+            url=f'{self.url}/repos/{repo.full_name}/releases/assets/{asset["id"]}',
+            browser_download_url=f'https://github.com/{repo.full_name}/releases/download/{asset["name"]}'
+        )
+
+
+REPO = r'/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)'
+
+
+@route('GET', r'/user')
+def get_user(fake, repo, **_):
+    return 200, {'login': fake.login, 'url': f'{fake.url}/user'}
+
+
+@route('GET', REPO)
+def get_repo(fake, repo, **_):
+    return 200, fake._repo_json(repo)
+
+
+@route('GET', REPO + r'/license')
+def get_license(fake, repo, **_):
+    if repo.license_key is None:
+        return 404, {'message': 'Not Found'}
+    return 200, {'license': {'key': repo.license_key, 'name': repo.license_key.upper(), 'url': f'{fake.url}/licenses/{repo.license_key}'}}
+
+
+@route('GET', REPO + r'/branches/(?P<branch>.+)')
+def get_branch(fake, repo, branch, **_):
+    proc = repo.git('rev-parse', f'refs/heads/{branch}', f'refs/heads/{branch}^{{tree}}', check=False)
+    if proc.returncode != 0:
+        return 404, {'message': 'Branch not found'}
+    commit, tree = proc.stdout.decode().split()
+    return 200, {'name': branch, 'commit': {'sha': commit, 'commit': {'tree': {'sha': tree}}}}
+
+
+@route('GET', REPO + r'/git/trees/(?P<ref>.+)')
+def get_tree(fake, repo, ref, query, **_):
+    args = ['ls-tree', '-l', ref]
+    if query.get('recursive'):
+        args.insert(1, '-r')
+        args.insert(2, '-t')
+    proc = repo.git(*args, check=False)
+    sha = repo.git('rev-parse', f'{ref}^{{tree}}', check=False)
+    if proc.returncode != 0 or sha.returncode != 0:
+        return 404, {'message': 'Not Found'}
+    tree = []
+    for line in proc.stdout.decode().splitlines():
+        meta, path = line.split('\t', 1)
+        mode, type_, obj, size = meta.split()
+        item = {'path': path, 'mode': mode, 'type': type_, 'sha': obj}
+        if type_ == 'blob':
+            item['size'] = int(size)
+        tree.append(item)
+    truncated = bool(query.get('recursive')) and fake.truncate_trees
+    if truncated:
+        tree = tree[:1]
+    return 200, {'sha': sha.stdout.decode().strip(), 'tree': tree, 'truncated': truncated}, {'ETag': f'"{sha.stdout.decode().strip()}"'}
+
+
+@route('GET', REPO + r'/git/blobs/(?P<sha>[0-9a-f]+)')
+def get_blob(fake, repo, sha, **_):
+    proc = repo.git('cat-file', 'blob', sha, check=False)
+    if proc.returncode != 0:
+        return 404, {'message': 'Not Found'}
+    content = base64.b64encode(proc.stdout).decode()
+    return 200, {'sha': sha, 'size': len(proc.stdout), 'content': content, 'encoding': 'base64'}, {'ETag': f'"{sha}"'}
+
+
+@route('GET', REPO + r'/contents/(?P<path>.*)')
+def get_contents(fake, repo, path, query, **_):
+    ref = query.get('ref', repo.default_branch)
+    path = path.strip('/')
+    spec = f'{ref}:{path}' if path else f'{ref}^{{tree}}'
+    kind = repo.git('cat-file', '-t', spec, check=False)
+    if kind.returncode != 0:
+        return 404, {'message': 'Not Found'}
+
+    def item(entry_path, type_, sha):
+        data = {
+            'type': 'dir' if type_ == 'tree' else 'file', 'name': entry_path.rsplit('/', 1)[-1], 'path': entry_path, 'sha': sha,
+            'url': f'{fake.url}/repos/{repo.full_name}/contents/{entry_path}?ref={ref}'
+        }
+        if type_ == 'blob':
+            content = repo.git('cat-file', 'blob', sha).stdout
+            data.update(content=base64.b64encode(content).decode(), encoding='base64', size=len(content))
+        return data
+
+    if kind.stdout.decode().strip() == 'blob':
+        return 200, item(path, 'blob', repo.git('rev-parse', spec).stdout.decode().strip())
+    listing = repo.git('ls-tree', spec).stdout.decode()
+    entries = []
+    for line in listing.splitlines():
+        meta, name = line.split('\t', 1)
+        _, type_, sha = meta.split()
+        entries.append(item(f'{path}/{name}'.strip('/'), type_, sha))
+    return 200, entries
+
+
+@route('GET', REPO + r'/git/refs/(?P<ref>.+)')
+def get_ref(fake, repo, ref, **_):
+    proc = repo.git('rev-parse', f'refs/{ref}', check=False)
+    if proc.returncode != 0:
+        return 404, {'message': 'Not Found'}
+    return 200, {
+        'ref': f'refs/{ref}',
+        'url': f'{fake.url}/repos/{repo.full_name}/git/refs/{ref}',
+        'object': {'sha': proc.stdout.decode().strip(), 'type': 'commit'}
+    }
+
+
+@route('PATCH', REPO + r'/git/refs/(?P<ref>.+)')
+def update_ref(fake, repo, ref, body, **_):
+    data = json.loads(body)
+    old = repo.git('rev-parse', f'refs/{ref}', check=False).stdout.decode().strip()
+    if old and not data.get('force') and repo.git('merge-base', '--is-ancestor', old, data['sha'], check=False).returncode != 0:
+        return 422, {'message': 'Update is not a fast forward'}
+    repo.git('update-ref', f'refs/{ref}', data['sha'])
+    return get_ref(fake, repo, ref)
+
+
+@route('POST', REPO + r'/git/blobs')
+def create_blob(fake, repo, body, **_):
+    data = json.loads(body)
+    content = base64.b64decode(data['content']) if data.get('encoding') == 'base64' else data['content'].encode()
+    sha = repo.git('hash-object', '-w', '--stdin', input=content).stdout.decode().strip()
+    return 201, {'sha': sha, 'url': f'{fake.url}/repos/{repo.full_name}/git/blobs/{sha}'}
+
+
+@route('POST', REPO + r'/git/trees')
+def create_tree(fake, repo, body, **_):
+    data = json.loads(body)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, GIT_INDEX_FILE=os.path.join(tmp, 'index'))
+        if data.get('base_tree'):
+            repo.git('read-tree', data['base_tree'], env=env)
+        for entry in data['tree']:
+            if entry['sha'] is None:
+                repo.git('update-index', '--force-remove', entry['path'], env=env)
+            else:
+                repo.git('update-index', '--add', '--cacheinfo', f'{entry["mode"]},{entry["sha"]},{entry["path"]}', env=env)
+        sha = repo.git('write-tree', env=env).stdout.decode().strip()
+    return 201, {'sha': sha, 'url': f'{fake.url}/repos/{repo.full_name}/git/trees/{sha}'}
+
+
+@route('POST', REPO + r'/git/commits')
+def create_commit(fake, repo, body, **_):
+    data = json.loads(body)
+    author = data.get('author') or {'name': fake.login, 'email': f'{fake.login}@example.com'}
+    env = dict(os.environ, GIT_AUTHOR_NAME=author['name'], GIT_AUTHOR_EMAIL=author['email'],
+               GIT_COMMITTER_NAME=author['name'], GIT_COMMITTER_EMAIL=author['email'])
+    parents = [arg for parent in data['parents'] for arg in ('-p', parent)]
+    proc = repo.git('commit-tree', data['tree'], *parents, '-m', data['message'], env=env)
+    sha = proc.stdout.decode().strip()
+    return 201, {'sha': sha, 'tree': {'sha': data['tree']}, 'parents': [{'sha': p} for p in data['parents']]}
+
+
+@route('DELETE', REPO + r'/git/refs/(?P<ref>.+)')
+def delete_ref(fake, repo, ref, **_):
+    repo.git('update-ref', '-d', f'refs/{ref}')
+    return 204, None
+
+
+@route('GET', REPO + r'/pulls')
+def list_pulls(fake, repo, query, **_):
+    pulls = [
+        fake._pull_json(repo, p) for p in repo.pulls
+        if p['state'] == query.get('state', 'open')
+        and p['head']['ref'] == query.get('head', p['head']['ref']).split(':')[-1]
+        and p['base']['ref'] == query.get('base', p['base']['ref'])
+    ]
+    return 200, pulls
+
+
+@route('POST', REPO + r'/pulls')
+def create_pull(fake, repo, body, **_):
+    data = json.loads(body)
+    pull = {
+        'number': len(repo.pulls) + 1, 'state': 'open', 'title': data['title'], 'body': data.get('body'),
+        'head': {'ref': data['head']}, 'base': {'ref': data['base']}, 'labels': [], 'requested_reviewers': []
+    }
+    repo.pulls.append(pull)
+    return 201, fake._pull_json(repo, pull)
+
+
+@route('PATCH', REPO + r'/pulls/(?P<number>\d+)')
+def edit_pull(fake, repo, number, body, **_):
+    pull = repo.pulls[int(number) - 1]
+    pull.update(json.loads(body))
+    return 200, fake._pull_json(repo, pull)
+
+
+@route('PUT', REPO + r'/issues/(?P<number>\d+)/labels')
+def set_labels(fake, repo, number, body, **_):
+    labels = json.loads(body)
+    repo.pulls[int(number) - 1]['labels'] = labels
+    return 200, [{'name': label} for label in labels]
+
+
+@route('POST', REPO + r'/pulls/(?P<number>\d+)/requested_reviewers')
+def request_review(fake, repo, number, body, **_):
+    pull = repo.pulls[int(number) - 1]
+    pull['requested_reviewers'] = [{'login': login} for login in json.loads(body)['reviewers']]
+    return 201, fake._pull_json(repo, pull)
+
+
+@route('POST', REPO + r'/forks')
+def create_fork(fake, repo, **_):
+    """Only returns already existing fork of the user, as github does for repositories forked before"""
+    for other in fake.repos.values():
+        if other.parent == repo.full_name and other.full_name.startswith(f'{fake.login}/'):
+            return 202, fake._repo_json(other)
+    return 422, {'message': 'Forking is not supported by the fake'}
+
+
+@route('POST', REPO + r'/dispatches')
+def dispatch(fake, repo, **_):
+    return 204, None
+
+
+@route('GET', REPO + r'/releases')
+def list_releases(fake, repo, **_):
+    return 200, [fake._release_json(repo, r) for r in reversed(repo.releases)]
+
+
+@route('GET', REPO + r'/releases/latest')
+def latest_release(fake, repo, **_):
+    published = [r for r in repo.releases if not r['draft']]
+    if not published:
+        return 404, {'message': 'Not Found'}
+    return 200, fake._release_json(repo, published[-1])
+
+
+@route('POST', REPO + r'/releases')
+def create_release(fake, repo, body, **_):
+    data = json.loads(body)
+    rel = {
+        'id': next(fake._ids), 'tag_name': data['tag_name'], 'name': data.get('name'), 'body': data.get('body'),
+        'draft': data.get('draft', False), 'prerelease': False, 'assets': []
+    }
+    repo.releases.append(rel)
+    return 201, fake._release_json(repo, rel)
+
+
+def _find_release(repo, release_id):
+    for rel in repo.releases:
+        if rel['id'] == int(release_id):
+            return rel
+    return None
+
+
+@route('PATCH', REPO + r'/releases/(?P<release_id>\d+)')
+def update_release(fake, repo, release_id, body, **_):
+    rel = _find_release(repo, release_id)
+    data = json.loads(body)
+    rel.update({k: v for k, v in data.items() if k in ('name', 'body', 'draft', 'tag_name')})
+    return 200, fake._release_json(repo, rel)
+
+
+@route('DELETE', REPO + r'/releases/(?P<release_id>\d+)')
+def delete_release(fake, repo, release_id, **_):
+    repo.releases.remove(_find_release(repo, release_id))
+    return 204, None
+
+
+@route('GET', REPO + r'/releases/(?P<release_id>\d+)/assets')
+def list_assets(fake, repo, release_id, **_):
+    return 200, [fake._asset_json(repo, a) for a in _find_release(repo, release_id)['assets']]
+
+
+@route('POST', r'/uploads' + REPO + r'/releases/(?P<release_id>\d+)/assets')
+def upload_asset(fake, repo, release_id, query, body, **_):
+    rel = _find_release(repo, release_id)
+    name = query['name']
+    rel['assets'] = [a for a in rel['assets'] if a['name'] != name]
+    asset = {'id': next(fake._ids), 'name': name, 'label': query.get('label', ''), 'size': len(body), 'state': 'uploaded'}
+    if fake.fail_uploads.get(name):
+        fake.fail_uploads[name] -= 1
+        asset.update(state='starter', size=0)
+        rel['assets'].append(asset)
+        return 502, {'message': 'Upload interrupted'}
+    rel['assets'].append(asset)
+    return 201, fake._asset_json(repo, asset)
+
+
+@route('DELETE', REPO + r'/releases/assets/(?P<asset_id>\d+)')
+def delete_asset(fake, repo, asset_id, **_):
+    for rel in repo.releases:
+        rel['assets'] = [a for a in rel['assets'] if a['id'] != int(asset_id)]
+    return 204, None
+
@@ -4,12 +4,21 @@ import argparse
 import json
 import sys
 import pathlib
+import traceback
+import concurrent.futures
+from typing import Optional, Tuple
 
 import github
 
-from scripts import FogRepoManager, BOT_USER
+from scripts import FogRepoManager, BOT_USER, RATE_LIMITER, STATUS_FAILED, connect
 from context import UserRepoContext
 from update_templates import copy_workflows, dump_readme
+from sync_all import print_summary
+
+
+STATUS_ONBOARDED = 'onboarded'
+
+PUSH_BATCH = 500  # refspecs per push, keeps command line short enough on every platform
 
 
 def edit_metadata(man: FogRepoManager):
@@ -30,95 +39,166 @@ def watch_fork(man: FogRepoManager):
     man.user.add_to_watched(man.fork)
 
 
-def purge_content(man: FogRepoManager):
+def _remote_refs(c: UserRepoContext, default_branch) -> list:
+    """All branches except the default one and all tags of origin, listed by a single ls-remote"""
+    refs = []
+    for line in c.run('git ls-remote --heads --tags origin').stdout.splitlines():
+        ref = line.split('\t', 1)[-1]
+        if not ref.startswith('refs/') or ref.endswith('^{}') or ref == f'refs/heads/{default_branch}':
+            continue
+        refs.append(ref)
+    return refs
+
+
+def purge_content(man: FogRepoManager, dry_run=False):
     """
     Remove all content and create first commit with our files.
     Allows standard synchronization flow for the first time.
+    With dry_run only reports what would be removed.
     """
-    print('== deleting releases thorugh api')
-    for rel in man.fork.get_releases():
-        rel.delete_release()
-
-    print('== initialize new github repo and force push with only our template files')
+    releases = list(man.fork.get_releases())
     with UserRepoContext(man.token, man.user.login, BOT_USER.login, BOT_USER.email, man.fork.name, clone=False) as c:
+        refs = _remote_refs(c, man.fork.default_branch)
+        if dry_run:
+            print(f'== {man.fork.full_name}: would delete {len(releases)} releases: {[rel.tag_name for rel in releases]}')
+            print(f'== {man.fork.full_name}: would delete {len(refs)} branches and tags: {refs}')
+            print(f'== {man.fork.full_name}: would force push master with only our template files')
+            return
+
+        print('== deleting releases thorugh api')
+        man.aio.run(*[man.aio.request('DELETE', rel.url) for rel in releases])
+
+        print('== initialize new github repo and force push with only our template files, deleting other branches and tags')
         copy_workflows(repo_dir=c.cwd)
         dump_readme(repo_dir=c.cwd, man=man)
         c.run(f'git add .')
         c.run(f'git commit -m "Reset repository"')
-        c.run(f'git push -u --force origin master')
+        refspecs = [f':{ref}' for ref in refs]
+        for i in range(0, len(refspecs) or 1, PUSH_BATCH):
+            c.run(f'git push -u --force origin master {" ".join(refspecs[i:i + PUSH_BATCH])}')
 
-        print('== deleting all branches except default branch')
-        for branch in man.fork.get_branches():
-            if branch.name == man.fork.default_branch:
-                continue
-            c.run(f'git push --delete origin {branch.name}')
 
-        print('== deleting tags')
-        for tag in man.fork.get_tags():
-            c.run(f'git push origin :refs/tags/{tag.name}')
+def find_fork(g: github.Github, original_repo) -> Optional[github.Repository.Repository]:
+    """Our fork named the same as original repository, if any"""
+    try:
+        fork = g.get_repo(f'{g.get_user().login}/{original_repo.name}')
+    except github.UnknownObjectException:
+        return None
+    if fork.fork and fork.parent.full_name == original_repo.full_name:
+        return fork
+    return None
 
 
 def fork_repo(token: str, repo_name: str) -> github.Repository.Repository:
     """
     Forks repository if not already forked. Returns our fork.
     """
-    g = github.Github(token)
+    g = connect(token)
     fog_user = g.get_user()
 
     original_repo = g.get_repo(repo_name)
-    for fork in original_repo.get_forks():
-        if fork.owner.login == fog_user.login:
-            break
-    else:
-        print(f'{repo_name} is not forked yet. Let us fork!')
-        fork = fog_user.create_fork(original_repo)
-    return fork
+    fork = find_fork(g, original_repo)
+    if fork is not None:
+        return fork
+    # github returns already existing fork, also when it was renamed
+    print(f'{repo_name} is not forked under its name. Let us fork!')
+    return fog_user.create_fork(original_repo)
 
 
-def add_to_synced(fork_name: str):
+def add_to_synced(fork_names: list):
     """
-    Adds FoG fork repo to config.json
+    Adds FoG fork repos to config.json
     """
     print('=== adding to sync config')
     SYNC_CONFIG_PATH = os.path.join('config.json')
     with open(SYNC_CONFIG_PATH, 'r') as f:
         config = json.load(f)
-    if fork_name in config['forks_to_sync']:
+    new_names = [name for name in fork_names if name not in config['forks_to_sync']]
+    if not new_names:
         print('=== already added')
         return
-    config['forks_to_sync'].append(fork_name)
-    with open(SYNC_CONFIG_PATH, 'w') as f:
+    config['forks_to_sync'].extend(new_names)
+    tmp_path = SYNC_CONFIG_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
         json.dump(config, f, indent=4)
+    os.replace(tmp_path, SYNC_CONFIG_PATH)
 
 
 def invite_ci_bot(man: FogRepoManager):
-    bot = github.Github().get_user(BOT_USER.login)
+    bot = connect().get_user(BOT_USER.login)
     permission_level = 'push'
     man.fork.add_to_collaborators(bot, permission_level)
 
 
-def wait_and_accept_invitations_by_bot(bot_token, timeout):
-    authenticated_bot = github.Github(bot_token).get_user()
+def wait_and_accept_invitations_by_bot(bot_token, repo_names, timeout):
+    """Accepts invitations to all given repositories, polling with growing interval"""
+    authenticated_bot = connect(bot_token).get_user()
+    pending = set(repo_names)
     timeout_stamp = time.time() + timeout
-    while time.time() < timeout_stamp:
+    delay = 0.5
+    while True:
         for i in authenticated_bot.get_invitations():
-            authenticated_bot.accept_invitation(i)
-            print(f'Bot accepted invitation {i}')
+            if i.repository.full_name in pending:
+                authenticated_bot.accept_invitation(i)
+                print(f'Bot accepted invitation {i}')
+                pending.discard(i.repository.full_name)
+        if not pending:
             return
-        print('No invitations received by bot...')
-        time.sleep(1)
-    raise RuntimeError(f'No invitation received by bot in {timeout} seconds')
+        if time.time() + delay > timeout_stamp:
+            raise RuntimeError(f'No invitation received by bot in {timeout} seconds for {sorted(pending)}')
+        print(f'Waiting for bot invitations to {sorted(pending)}...')
+        time.sleep(delay)
+        delay = min(delay * 2, 5)
+
+
+def onboard(token, repo_name, purge=False) -> Tuple[str, str, bool]:
+    """
+    Forks original repository, watches and edits metadata of the fork, optionally purges its content and invites the bot.
+    Returns full name and new name of the fork and whether bot was invited
+    """
+    fork = fork_repo(token, repo_name)
+    man = FogRepoManager(token, fork.full_name)
+    watch_fork(man)
+    updated_repo_name = edit_metadata(man)
+    if purge:
+        purge_content(man)
+    invited = False
+    if BOT_USER.login not in [i.login for i in man.fork.get_collaborators()]:
+        invite_ci_bot(man)
+        invited = True
+    return man.fork.full_name, updated_repo_name, invited
+
+
+def check_purge(token, repo_name):
+    """Reports what purge would remove from our fork of original repository (or from given fork), without changing anything"""
+    g = connect(token)
+    repo = g.get_repo(repo_name)
+    fork = repo if repo.owner.login == g.get_user().login else find_fork(g, repo)
+    if fork is None:
+        raise RuntimeError(f'{repo_name} is not forked yet or its fork was renamed')
+    purge_content(FogRepoManager(token, fork.full_name), dry_run=True)
+
+
+def read_repo_names(path) -> list:
+    """One original repository full name per line; empty lines and # comments are skipped"""
+    with open(path, 'r') as f:
+        lines = [line.split('#', 1)[0].strip() for line in f]
+    return [line for line in lines if line]
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('repo', help="Original repository full name for example user/galaxy-plugin-xxx")
+    parser.add_argument('repos', nargs='*', help="Original repositories full names for example user/galaxy-plugin-xxx")
+    parser.add_argument('--file', help="file with original repositories full names, one per line")
     parser.add_argument('--purge', action='store_true', help="delete all files and commit. Used after initial fork")
+    parser.add_argument('--dry-run', action='store_true', help="only report what --purge would remove from existing forks")
+    parser.add_argument('--workers', type=int, default=8, help="maximum number of repositories onboarded at once")
 
     if len(sys.argv) < 2:
         parser.print_help()
         sys.exit(0)
     args = parser.parse_args()
+    repo_names = args.repos + (read_repo_names(args.file) if args.file else [])
 
     try:
         token = os.environ['FOG_GITHUB_TOKEN']
@@ -129,16 +209,41 @@ if __name__ == "__main__":
     except KeyError:
         raise RuntimeError('BOT_TOKEN required as environmental variable')
 
-    fork = fork_repo(token, args.repo)
-    man = FogRepoManager(token, fork.full_name)
-    watch_fork(man)
-    updated_repo_name = edit_metadata(man)
-    add_to_synced(updated_repo_name)
-    if args.purge:
-        msg = 'Unreversable decision. Are you sure you want to remove all the content, all branches and releases from this repository?'
-        if input(f"{msg} (y/N)? ").lower() == 'y':
-            purge_content(man)
+    workers = max(1, min(args.workers, len(repo_names)))
+    if args.dry_run:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            checks = [executor.submit(check_purge, token, name) for name in repo_names]
+        for name, check in zip(repo_names, checks):
+            if check.exception() is not None:
+                print(f'===== {name}: {STATUS_FAILED} {repr(check.exception())}')
+        sys.exit(1 if any(check.exception() is not None for check in checks) else 0)
 
-    if BOT_USER.login not in [i.login for i in fork.get_collaborators()]:
-        invite_ci_bot(man)
-        wait_and_accept_invitations_by_bot(bot_token, timeout=5)
+    purge = False
+    if args.purge:
+        msg = 'Unreversable decision. Are you sure you want to remove all the content, all branches and releases from'
+        purge = input(f"{msg} {', '.join(repo_names)} (y/N)? ").lower() == 'y'
+
+    results, onboarded, invited = {}, [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(onboard, token, name, purge): (name, time.monotonic()) for name in repo_names}
+        for future in concurrent.futures.as_completed(futures):
+            name, start = futures[future]
+            try:
+                full_name, updated_repo_name, bot_invited = future.result()
+            except Exception:
+                print(f'===== {name}: {STATUS_FAILED}')
+                traceback.print_exc()
+                results[name] = (STATUS_FAILED, time.monotonic() - start)
+                continue
+            results[name] = (STATUS_ONBOARDED, time.monotonic() - start)
+            onboarded.append(updated_repo_name)
+            if bot_invited:
+                invited.append(full_name)
+
+    add_to_synced(sorted(onboarded))
+    if invited:
+        wait_and_accept_invitations_by_bot(bot_token, invited, timeout=10)
+    print_summary({name: results[name] for name in repo_names})
+    print(RATE_LIMITER)
+    if len(onboarded) < len(repo_names):
+        sys.exit(1)
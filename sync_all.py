@@ -0,0 +1,138 @@
+"""Script for synchronizing all forks listed in config.json with their original repositories at once"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import contextlib
+import concurrent.futures
+
+from context import UserRepoContext
+from scripts import (
+    FogRepoManager, SyncState, MirrorCache, BOT_USER, FOG_USER, STATUS_SYNCED, STATUS_UP_TO_DATE, STATUS_FAILED,
+    check_upstream_version, sync
+)
+
+
+def sync_fork(repo_name, token, use_mirrors=True) -> str:
+    """Runs sync for a single fork in its own fresh clone. Meant to be run by run_per_fork"""
+    try:
+        man = FogRepoManager(token, f'{FOG_USER.login}/{repo_name}')
+        state = SyncState(man.fork.full_name)
+        upstream_ver = check_upstream_version(man, state)
+        if upstream_ver is None:
+            state.record(STATUS_UP_TO_DATE)
+            return STATUS_UP_TO_DATE
+        mirrors = MirrorCache() if use_mirrors else None
+        prev_cwd = os.getcwd()
+        with UserRepoContext(token, FOG_USER.login, BOT_USER.login, BOT_USER.email, repo_name, mirrors=mirrors) as c:
+            os.chdir(c.cwd)
+            try:
+                pushed = sync(man, mirrors, state, upstream_ver)
+            finally:
+                os.chdir(prev_cwd)
+        if pushed:
+            man.send_repository_dispatch('validation')
+        return STATUS_SYNCED if pushed else STATUS_UP_TO_DATE
+    except Exception as e:
+        SyncState(f'{FOG_USER.login}/{repo_name}').record(STATUS_FAILED, repr(e))
+        raise
+
+
+def _run_captured(func, name, args):
+    """Worker side of run_per_fork. Returns (status, duration, log)"""
+    start = time.monotonic()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            status = func(name, *args)
+        except Exception:
+            traceback.print_exc(file=log)
+            status = STATUS_FAILED
+    return status, time.monotonic() - start, log.getvalue()
+
+
+def run_per_fork(func, names, workers, *args) -> dict:
+    """Runs func(name, *args) returning status for each fork in a pool of processes,
+    as tasks working on current directory cannot share one. Output of each fork is printed at once when it finishes;
+    exception makes its status failed. Returns {name: (status, duration)} in order of names
+    """
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run_captured, func, name, args): name for name in names}
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                status, duration, log = future.result()
+            except Exception as e:  # worker process died
+                status, duration, log = STATUS_FAILED, 0.0, repr(e)
+            print(f'===== {name}: {status}\n{log}')
+            results[name] = (status, duration)
+    return {name: results[name] for name in names}
+
+
+def print_summary(results):
+    width = max([len(name) for name in results] + [len('fork')])
+    print(f'{"fork":<{width}} | {"status":<10} | duration')
+    print(f'{"-" * width}-+-{"-" * 10}-+---------')
+    for name, (status, duration) in results.items():
+        print(f'{name:<{width}} | {status:<10} | {duration:7.1f}s')
+
+
+def _ago(timestamp) -> str:
+    if timestamp is None:
+        return 'never'
+    minutes = int(time.time() - timestamp) // 60
+    if minutes < 120:
+        return f'{minutes}m ago'
+    return f'{minutes // 60}h ago' if minutes < 48 * 60 else f'{minutes // (24 * 60)}d ago'
+
+
+def print_report(names=None):
+    """Freshness of the fleet from states recorded by the last syncs, without touching network"""
+    states = [s for s in SyncState.all() if names is None or s.get('fork').split('/')[-1] in names]
+    columns = ['fork', 'upstream', 'fork ver', 'branch', 'license', 'outcome', 'checked', 'upstream head']
+    rows = [[
+        s.get('fork').split('/')[-1], s.get('upstream_version') or '?', s.get('fork_version') or '-',
+        s.get('release_branch') or '?', s.get('license') or '?', s.get('outcome') or '?',
+        _ago(s.get('finished_at')), (s.get('upstream_sha') or '?')[:10]
+    ] for s in states]
+    widths = [max([len(c)] + [len(r[i]) for r in rows]) for i, c in enumerate(columns)]
+    print(' | '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    print('-+-'.join('-' * w for w in widths))
+    for state, row in zip(states, rows):
+        print(' | '.join(v.ljust(w) for v, w in zip(row, widths)))
+        if state.get('error'):
+            print(f'    {state.get("error")}')
+    missing = set(names or []) - {row[0] for row in rows}
+    if missing:
+        print(f'Never synced here: {", ".join(sorted(missing))}')
+
+
+def sync_all(token, names, workers, use_mirrors=True):
+    return run_per_fork(sync_fork, names, workers, token, use_mirrors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('forks', nargs='*', help='fork names to sync; defaults to forks_to_sync from config.json')
+    parser.add_argument('--workers', type=int, default=16, help='maximum number of forks synchronized at once')
+    parser.add_argument('--no-mirrors', action='store_true', help='clone and fetch without local mirrors of repositories')
+    parser.add_argument('--report', action='store_true', help='only show state recorded by the last syncs, offline')
+    args = parser.parse_args()
+
+    with open('config.json', 'r') as f:
+        names = args.forks or json.load(f)['forks_to_sync']
+
+    if args.report:
+        print_report(names)
+        sys.exit(0)
+
+    tkn = os.environ['GITHUB_TOKEN']
+    results = sync_all(tkn, names, max(1, min(args.workers, len(names))), not args.no_mirrors)
+    print_summary(results)
+    if any(status == STATUS_FAILED for status, _ in results.values()):
+        sys.exit(1)
@@ -8,7 +8,8 @@ import json
 import pytest
 import logging
 import subprocess
-from distutils.version import StrictVersion
+
+from scripts import Version
 
 
 @pytest.fixture()
@@ -26,7 +27,7 @@ def test_manifest_elements(manifest):
 
 def test_manifest_version_versus_master_branch(manifest, capsys):
     """Galaxy downloads plugins only if the version is higher than in local copy.
-    Check if new version will be bumped using StrictVersion comparison
+    Check if new version will be bumped using the same version comparison as sync
     """
     proc = subprocess.run(
         ["git", "show", "origin/master:current_version.json"],
@@ -40,4 +41,4 @@ def test_manifest_version_versus_master_branch(manifest, capsys):
         return
     prev_ver = json.loads(proc.stdout)['tag_name']
 
-    assert StrictVersion(manifest['version']) > StrictVersion(prev_ver)
+    assert Version(manifest['version']) > Version(prev_ver)
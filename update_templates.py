@@ -1,16 +1,24 @@
 """Script for updating github workflows for all our integration forks that have to be synchronized with original repository"""
 
 import os
+import sys
 import json
+import shlex
+import argparse
 import subprocess
 import shutil
 import glob
 
 from context import UserRepoContext
-from scripts import FogRepoManager, BOT_USER, FOG_USER
+from scripts import FogRepoManager, BOT_USER, FOG_USER, FOG_BASE, RATE_LIMITER, STATUS_FAILED
+from sync_all import print_summary, run_per_fork
 
 
-def dump_readme(repo_dir, man: FogRepoManager):
+STATUS_UPDATED = 'updated'
+STATUS_UNCHANGED = 'unchanged'
+
+
+def render_readme(man: FogRepoManager) -> str:
     title = man.fork.name
     url = man.parent.html_url
     license_type = man.get_parent_license().key
@@ -21,9 +29,12 @@ def dump_readme(repo_dir, man: FogRepoManager):
         cp = f'Copyright {man.parent.created_at.year} [{owner.name or owner.login}]({owner.html_url})'
 
     with open(os.path.join('templates', 'README.md'), 'r') as f:
-        readme = f.read().format(title=title, url=url, copyright=cp)
-        with open(os.path.join(repo_dir, 'README.md'), 'w') as g:
-            g.write(readme)
+        return f.read().format(title=title, url=url, copyright=cp)
+
+
+def dump_readme(repo_dir, man: FogRepoManager):
+    with open(os.path.join(repo_dir, 'README.md'), 'w') as g:
+        g.write(render_readme(man))
 
 
 def copy_workflows(repo_dir):
@@ -33,21 +44,64 @@ def copy_workflows(repo_dir):
         shutil.copy(file_, target)
 
 
+def render_templates(man: FogRepoManager) -> dict:
+    """Files the same as copy_workflows and dump_readme write, as {path in repository: content}"""
+    files = {'README.md': render_readme(man).encode()}
+    for file_ in glob.glob(r'templates/.github/workflows/*.yml'):
+        with open(file_, 'rb') as f:
+            files[f'.github/workflows/{os.path.basename(file_)}'] = f.read()
+    return files
+
+
+def update_fork(repo_name, token, message, api_only=False) -> str:
+    """Renders templates into a shallow clone of the fork; commits and pushes only if anything changed.
+    With api_only changed files are committed through github API instead, without cloning.
+    Meant to be run by run_per_fork
+    """
+    try:
+        man = FogRepoManager(token, f'{FOG_USER.login}/{repo_name}')
+        if api_only:
+            commit = man.commit_files(render_templates(man), message)
+            print(f'> pushed {commit}' if commit else '> templates already up to date')
+            return STATUS_UPDATED if commit else STATUS_UNCHANGED
+        return _update_clone(token, repo_name, man, message)
+    finally:
+        print(RATE_LIMITER)
+
+
+def _update_clone(token, repo_name, man: FogRepoManager, message) -> str:
+    with UserRepoContext(token, FOG_USER.login, BOT_USER.login, BOT_USER.email, repo_name, depth=1, branch=FOG_BASE) as c:
+        print('> copying workflow files')
+        copy_workflows(repo_dir=c.cwd)
+        dump_readme(repo_dir=c.cwd, man=man)
+        c.run('git add --all')
+        if c.run('git diff --cached --quiet', check=False).returncode == 0:
+            print('> templates already up to date')
+            return STATUS_UNCHANGED
+        c.run(f'git commit -m {shlex.quote(message)}')
+        c.run(f'git push origin {FOG_BASE}')
+        return STATUS_UPDATED
+
+
+def update_all(token, names, message, workers, api_only=False):
+    return run_per_fork(update_fork, names, workers, token, message, api_only)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('forks', nargs='*', help='fork names to update; defaults to forks_to_sync from config.json')
+    parser.add_argument('--workers', type=int, default=8, help='maximum number of forks updated at once')
+    parser.add_argument('--api', action='store_true', help='commit changed files through github API instead of cloning forks')
+    args = parser.parse_args()
 
     with open('config.json', 'r') as f:
-        names = json.load(f)['forks_to_sync']
+        names = args.forks or json.load(f)['forks_to_sync']
 
     tkn = os.environ['GITHUB_TOKEN']
     proc = subprocess.run(['git', 'show', '-s', '--format=%B', 'HEAD'], text=True, capture_output=True)
     last_commit_msg = proc.stdout.strip()
 
-    for repo_name in names:
-        man = FogRepoManager(tkn, f'{FOG_USER.login}/{repo_name}')
-
-        with UserRepoContext(tkn, FOG_USER.login, BOT_USER.login, BOT_USER.email, repo_name) as c:
-            print('> copying workflow files')
-            copy_workflows(repo_dir=c.cwd)
-            dump_readme(repo_dir=c.cwd, man=man)
-            c.run(f'git commit -a -m "{last_commit_msg}"')
-            c.run(f'git push origin master')
+    results = update_all(tkn, names, last_commit_msg, max(1, min(args.workers, len(names))), args.api)
+    print_summary(results)
+    if any(status == STATUS_FAILED for status, _ in results.values()):
+        sys.exit(1)
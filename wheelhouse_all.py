@@ -0,0 +1,57 @@
+"""Script for populating one wheelhouse with dependencies of all forks listed in config.json.
+Requirements of every fork are compiled concurrently, then distributions are downloaded once for all of them.
+Forks can be built offline afterwards with: scripts.py build --wheelhouse DIR
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from context import UserRepoContext
+from scripts import Wheelhouse, BOT_USER, FOG_USER, FOG_BASE, PIP_PLATFORMS, STATUS_FAILED, populate_wheelhouse
+from sync_all import print_summary, run_per_fork
+
+
+STATUS_COMPILED = 'compiled'
+
+
+def compile_fork(repo_name, token, directory) -> str:
+    """Compiles requirements of fork's master branch into wheelhouse in a shallow clone. Meant to be run by run_per_fork"""
+    prev_cwd = os.getcwd()
+    with UserRepoContext(token, FOG_USER.login, BOT_USER.login, BOT_USER.email, repo_name, depth=1, branch=FOG_BASE) as c:
+        os.chdir(c.cwd)
+        try:
+            populate_wheelhouse(Wheelhouse(directory), targets=[])
+        finally:
+            os.chdir(prev_cwd)
+    return STATUS_COMPILED
+
+
+def populate_all(token, names, directory, targets, workers):
+    results = run_per_fork(compile_fork, names, workers, token, directory)
+    wheelhouse = Wheelhouse(directory)
+    for target in targets:
+        wheelhouse.populate(wheelhouse.locks(), PIP_PLATFORMS[target])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dir', help='wheelhouse directory')
+    parser.add_argument('forks', nargs='*', help='fork names; defaults to forks_to_sync from config.json')
+    parser.add_argument('--targets', default=','.join(PIP_PLATFORMS), help=f'comma separated platforms: {",".join(PIP_PLATFORMS)}')
+    parser.add_argument('--workers', type=int, default=8, help='maximum number of forks compiled at once')
+    args = parser.parse_args()
+    targets = args.targets.split(',')
+    if set(targets) - set(PIP_PLATFORMS):
+        parser.error(f'unknown targets: {", ".join(sorted(set(targets) - set(PIP_PLATFORMS)))}')
+
+    with open('config.json', 'r') as f:
+        names = args.forks or json.load(f)['forks_to_sync']
+
+    tkn = os.environ['GITHUB_TOKEN']
+    results = populate_all(tkn, names, os.path.abspath(os.path.expanduser(args.dir)), targets, max(1, min(args.workers, len(names))))
+    print_summary(results)
+    if any(status == STATUS_FAILED for status, _ in results.values()):
+        sys.exit(1)